@@ -2,7 +2,11 @@ import { PipeInstance } from "@/app/ai/BuildableBoard";
 import { runInference } from "@/app/ai/model";
 import { validator as connectedValidator } from "./csp/constraints/connected";
 import { validator as noCyclesValidator } from "./csp/constraints/no_cycles";
-import { validatorH, validatorV } from "./csp/constraints/no_half_connections";
+import {
+  validatorAllH,
+  validatorAllV,
+} from "./csp/constraints/no_half_connections";
+import { openingsToPipe } from "./csp/utils";
 
 export function getPipeType(boolArray: Array<boolean>): string {
   // Count the number of true values
@@ -163,15 +167,15 @@ export function isSolved(boardState: Array<PipeInstance | null>) {
   if (!boardState.every((pipe) => pipe !== null)) {
     throw new Error("Board is not full");
   }
-  // Convert to 2D array of booleans
+  // Convert to an array of PipeType bitmasks
   const board2D = boardState.map((pipe) => {
-    return pipe.openings;
+    return openingsToPipe(pipe.openings);
   });
 
   return [
     connectedValidator(board2D),
     noCyclesValidator(board2D),
-    validatorH(board2D),
-    validatorV(board2D),
+    validatorAllH(board2D),
+    validatorAllV(board2D),
   ].every((validator) => validator);
 }
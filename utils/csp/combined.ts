@@ -1,4 +1,10 @@
-import { Openings } from "./utils";
+import {
+  PipeType,
+  PIPE_TOP,
+  PIPE_RIGHT,
+  PIPE_BOTTOM,
+  PIPE_LEFT,
+} from "./utils";
 import {
   noHalfConnectionsValidatorH,
   noHalfConnectionsValidatorV,
@@ -11,61 +17,44 @@ import {
 } from "./constraints";
 import { CSP, Variable, Constraint } from "./csp";
 
+// all the possible domains for pipes in the pipes puzzle
+// 0b1111 and 0b0000 are omitted - they represent all connections or no connections, which are immune to rotations.
+const DOMAIN_PIPES: readonly PipeType[] = [
+  PIPE_TOP | PIPE_RIGHT | PIPE_BOTTOM,
+  PIPE_TOP | PIPE_RIGHT | PIPE_LEFT,
+  PIPE_TOP | PIPE_RIGHT,
+  PIPE_TOP | PIPE_BOTTOM | PIPE_LEFT,
+  PIPE_TOP | PIPE_BOTTOM,
+  PIPE_TOP | PIPE_LEFT,
+  PIPE_TOP,
+  PIPE_RIGHT | PIPE_BOTTOM | PIPE_LEFT,
+  PIPE_RIGHT | PIPE_BOTTOM,
+  PIPE_RIGHT | PIPE_LEFT,
+  PIPE_RIGHT,
+  PIPE_BOTTOM | PIPE_LEFT,
+  PIPE_BOTTOM,
+  PIPE_LEFT,
+];
+
+// domains that have already been generated, keyed by the boundary mask
+const DOMAIN_CACHE = new Map<number, readonly PipeType[]>();
+
 /**
- * Generate a domain based on the four boolean flags:
- * if i == 0: 0 is false (top)
- * if i == n-1: 2 is false (bottom)
- * if j == 0: 3 is false (left)
- * if j == n-1: 1 is false (right)
+ * Generate a domain for a pipe based on which of its sides are on the boundary of the grid:
+ * if i == 0: PIPE_TOP is blocked
+ * if j == n-1: PIPE_RIGHT is blocked
+ * if i == n-1: PIPE_BOTTOM is blocked
+ * if j == 0: PIPE_LEFT is blocked
  *
- * @param top A boolean indicating if the top of the pipe is blocked.
- * @param right A boolean indicating if the right of the pipe is blocked.
- * @param bottom A boolean indicating if the bottom of the pipe is blocked.
- * @param left A boolean indicating if the left of the pipe is blocked.
- * @returns A list of PipeType objects representing the domain.
+ * @param boundary A mask of the openings that are blocked, as they would point off the grid.
+ * @returns A shared, read-only list of PipeType objects representing the domain.
  */
-export function generateDomain(
-  top: boolean,
-  right: boolean,
-  bottom: boolean,
-  left: boolean
-): Openings[] {
-  // all the possible domains for pipes in the pipes puzzle
-  // [true, true, true, true] and [false, false, false, false] are omitted - they represent all connections or no connections, which are immune to rotations.
-  let domain: Openings[] = [
-    [true, true, true, false],
-    [true, true, false, true],
-    [true, true, false, false],
-    [true, false, true, true],
-    [true, false, true, false],
-    [true, false, false, true],
-    [true, false, false, false],
-    [false, true, true, true],
-    [false, true, true, false],
-    [false, true, false, true],
-    [false, true, false, false],
-    [false, false, true, true],
-    [false, false, true, false],
-    [false, false, false, true],
-  ];
-
-  if (top) {
-    // remove pipes that point up if the pipe is at the top of the grid
-    domain = domain.filter((pipe) => !pipe[0]);
-  }
-  if (bottom) {
-    // remove pipes that point down if the pipe is at the bottom of the grid
-    domain = domain.filter((pipe) => !pipe[2]);
-  }
-  if (right) {
-    // remove pipes that point right if the pipe is on the right side of the grid
-    domain = domain.filter((pipe) => !pipe[1]);
-  }
-  if (left) {
-    // remove pipes that point left if the pipe is on the left side of the grid
-    domain = domain.filter((pipe) => !pipe[3]);
+export function generateDomain(boundary: number): readonly PipeType[] {
+  let domain = DOMAIN_CACHE.get(boundary);
+  if (domain === undefined) {
+    domain = DOMAIN_PIPES.filter((pipe) => (pipe & boundary) === 0);
+    DOMAIN_CACHE.set(boundary, domain);
   }
-
   return domain;
 }
 
@@ -75,104 +64,70 @@ export function generateDomain(
  * @returns A CSP object representing the pipes puzzle
  */
 export function createPipesCSP(n: number): CSP {
-  const variables: Variable[] = [];
-
   // initialize variable objects
-  for (let i = 0; i < n; i++) {
-    const row: Variable[] = [];
-    for (let j = 0; j < n; j++) {
-      const top = i === 0;
-      const bottom = i === n - 1;
-      const left = j === 0;
-      const right = j === n - 1;
-
-      const v = new Variable(
-        i * n + j,
-        generateDomain(top, right, bottom, left)
-      );
-
-      row.push(v);
+  const variables = Array.from({ length: n * n }, (_, loc) => {
+    const i = Math.floor(loc / n);
+    const j = loc % n;
+    let boundary = 0;
+    if (i === 0) {
+      boundary |= PIPE_TOP;
     }
-    variables.push(...row);
-  }
-
-  const allConstraints: Constraint[] = [];
+    if (j === n - 1) {
+      boundary |= PIPE_RIGHT;
+    }
+    if (i === n - 1) {
+      boundary |= PIPE_BOTTOM;
+    }
+    if (j === 0) {
+      boundary |= PIPE_LEFT;
+    }
+    return new Variable(loc, generateDomain(boundary));
+  });
 
   // create binary constraints for no blocking
-  const noHalfConnectionsConstraints: Constraint[] = [];
+  const constraints: Constraint[] = [];
 
   // start with horizontal constraints
-  const noHalfConnectionsH: Constraint[] = [];
   for (let i = 0; i < n; i++) {
     for (let j = 0; j < n - 1; j++) {
-      const left = variables[i * n + j];
-      const right = variables[i * n + j + 1];
-      const scope = [left, right];
-      const name = `no half-connections horizontal ${i * n + j}, ${
-        i * n + j + 1
-      }`;
-
-      noHalfConnectionsH.push(
+      const left = i * n + j;
+      const right = left + 1;
+      constraints.push(
         new Constraint(
-          name,
+          () => `no half-connections horizontal ${left}, ${right}`,
           noHalfConnectionsValidatorH,
           noHalfConnectionsPrunerH,
-          scope
+          [variables[left], variables[right]]
         )
       );
     }
   }
 
   // vertical constraints
-  const noHalfConnectionsV: Constraint[] = [];
   for (let i = 0; i < n - 1; i++) {
     for (let j = 0; j < n; j++) {
-      const above = variables[i * n + j];
-      const below = variables[(i + 1) * n + j];
-      const scope = [above, below];
-      const name = `no half-connections vertical ${i * n + j}, ${
-        (i + 1) * n + j
-      }`;
-
-      noHalfConnectionsV.push(
+      const above = i * n + j;
+      const below = above + n;
+      constraints.push(
         new Constraint(
-          name,
+          () => `no half-connections vertical ${above}, ${below}`,
           noHalfConnectionsValidatorV,
           noHalfConnectionsPrunerV,
-          scope
+          [variables[above], variables[below]]
         )
       );
     }
   }
 
-  // add constraints
-  noHalfConnectionsConstraints.push(
-    ...noHalfConnectionsH,
-    ...noHalfConnectionsV
-  );
-
   // create tree constraint
-  const treeConstraint = new Constraint(
-    "tree",
-    noCyclesValidator,
-    noCyclesPruner,
-    variables
+  constraints.push(
+    new Constraint("tree", noCyclesValidator, noCyclesPruner, variables)
   );
 
   // create connected constraint
-  const connectedConstraint = new Constraint(
-    "connected",
-    connectedValidator,
-    connectedPruner,
-    variables
-  );
-
-  // add all constraints
-  allConstraints.push(
-    ...noHalfConnectionsConstraints,
-    treeConstraint,
-    connectedConstraint
+  constraints.push(
+    new Constraint("connected", connectedValidator, connectedPruner, variables)
   );
 
-  return new CSP(`Pipes_${n}x${n}`, variables, allConstraints);
+  return new CSP(`Pipes_${n}x${n}`, variables, constraints);
 }
@@ -1,158 +1,162 @@
-import { Openings, findAdj, checkConnections } from "../utils";
+import {
+  PipeType,
+  PIPES_WITH_OPENINGS,
+  OPPOSITE,
+  adjTable,
+  connectedMask,
+} from "../utils";
 import { Variable } from "../csp";
 
-export function validator(pipes: Openings[]): boolean {
-  const visited: number[] = [];
-  dft(pipes, 0, visited);
-  return visited.length === pipes.length;
+// visited bitset for dft (bit loc & 31 of word loc >>> 5), kept between calls so the pruner's traversals don't allocate
+let visitedScratch = new Uint32Array(0);
+
+export function validator(pipes: ArrayLike<PipeType>): boolean {
+  return dft(pipes, 0, adjTable(Math.sqrt(pipes.length))) === pipes.length;
 }
 
-function dft(pipes: Openings[], loc: number, visited: number[]): void {
-  visited.push(loc);
-  const adjVals = findAdj(loc, Math.sqrt(pipes.length));
-
-  const topVal = adjVals[0] !== -1 ? pipes[adjVals[0]] : null;
-  const rightVal = adjVals[1] !== -1 ? pipes[adjVals[1]] : null;
-  const bottomVal = adjVals[2] !== -1 ? pipes[adjVals[2]] : null;
-  const leftVal = adjVals[3] !== -1 ? pipes[adjVals[3]] : null;
-
-  const connections = checkConnections(pipes[loc], [
-    topVal,
-    rightVal,
-    bottomVal,
-    leftVal,
-  ]);
-
-  for (let i = 0; i < 4; i++) {
-    if (connections[i] && !visited.includes(adjVals[i])) {
-      dft(pipes, adjVals[i], visited);
+/**
+ * Iterative depth-first traversal over the pipes connected to a starting pipe
+ * @param pipes The (pseudo) assignment to traverse
+ * @param start The location to start the traversal from
+ * @param adj The adjacency table of the grid, see adjTable
+ * @returns The number of pipes reachable from start
+ */
+function dft(
+  pipes: ArrayLike<PipeType>,
+  start: number,
+  adj: Int32Array
+): number {
+  const words = (pipes.length + 31) >>> 5;
+  if (visitedScratch.length !== words) {
+    visitedScratch = new Uint32Array(words);
+  } else {
+    visitedScratch.fill(0);
+  }
+  const visited = visitedScratch;
+  const stack = [start];
+  let count = 0;
+
+  while (stack.length > 0) {
+    const loc = stack.pop()!;
+    if (visited[loc >>> 5] & (1 << (loc & 31))) continue;
+    visited[loc >>> 5] |= 1 << (loc & 31);
+    count++;
+
+    const connections = connectedMask(loc, pipes, adj);
+    const base = loc * 4;
+
+    for (let i = 0; i < 4; i++) {
+      const adjIndex = adj[base + i];
+      if (
+        connections & (1 << i) &&
+        !(visited[adjIndex >>> 5] & (1 << (adjIndex & 31)))
+      ) {
+        stack.push(adjIndex);
+      }
     }
   }
+
+  return count;
 }
 
-export function pruner(variables: Variable[]): Map<Variable, Openings[]> {
-  const pruned = new Map<Variable, Openings[]>();
+export function pruner(variables: Variable[]): Map<Variable, number> {
+  const pruned = new Map<Variable, number>();
+
+  // only unassigned variables are ever pruned, so a full assignment has nothing to do
+  if (variables.every((v) => v.getAssignment() !== null)) {
+    return pruned;
+  }
+
   const pseudoAssignment = pseudoAssign(variables);
+  const adj = adjTable(Math.sqrt(pseudoAssignment.length));
 
-  const canBeConnected = validator(pseudoAssignment);
+  const canBeConnected =
+    dft(pseudoAssignment, 0, adj) === pseudoAssignment.length;
   if (!canBeConnected) {
     for (const v of variables) {
       if (v.getAssignment() === null) {
-        const domain = v.getActiveDomain();
-        pruned.set(v, [...domain]);
-        v.prune(domain);
+        pruned.set(v, v.activeMask);
+        v.pruneMask(v.activeMask);
         break;
       }
     }
   } else {
     for (let i = 0; i < pseudoAssignment.length; i++) {
-      findIsolatedPath(variables, pseudoAssignment, i, -1, pruned);
+      findIsolatedPath(variables, pseudoAssignment, adj, i, pruned);
     }
   }
 
   return pruned;
 }
 
-function pseudoAssign(variables: Variable[]): Openings[] {
-  const pseudoAssignment: Openings[] = [];
+function pseudoAssign(variables: Variable[]): Uint8Array {
+  const pseudoAssignment = new Uint8Array(variables.length);
 
-  for (const v of variables) {
+  for (let i = 0; i < variables.length; i++) {
+    const v = variables[i];
     const assignment = v.getAssignment();
     if (assignment !== null) {
-      pseudoAssignment.push(assignment);
+      pseudoAssignment[i] = assignment;
     } else {
-      const pseudoPipe: boolean[] = [false, false, false, false];
-      let allTrue = false;
-
+      // an unassigned pipe is open in every direction one of its active values is open in
+      let pseudoPipe = 0;
       for (const activeDomain of v.getActiveDomain()) {
-        for (let direction = 0; direction < 4; direction++) {
-          if (activeDomain[direction]) {
-            pseudoPipe[direction] = true;
-            if (pseudoPipe.filter(Boolean).length === 4) {
-              allTrue = true;
-              break;
-            }
-          }
-        }
-        if (allTrue) break;
+        pseudoPipe |= activeDomain;
+        if (pseudoPipe === 0b1111) break;
       }
 
-      pseudoAssignment.push(pseudoPipe as Openings);
+      pseudoAssignment[i] = pseudoPipe;
     }
   }
 
   return pseudoAssignment;
 }
 
+/**
+ * Follows the path starting at a dead end for as long as it doesn't branch, pruning values that would isolate it
+ */
 function findIsolatedPath(
   variables: Variable[],
-  pseudoAssignment: Openings[],
-  i: number,
-  lastDir: number,
-  pruned: Map<Variable, Openings[]>
+  pseudoAssignment: Uint8Array,
+  adj: Int32Array,
+  start: number,
+  pruned: Map<Variable, number>
 ): void {
-  const mainPipe = pseudoAssignment[i];
-  const mainVar = variables[i];
-  const adjIndex = findAdj(i, Math.sqrt(pseudoAssignment.length));
-  const toPrune: Openings[] = [];
-
-  // holds adjacent PipeTypes, not including the pipe that came before in the path
-  const adjPipeList: Array<Openings | null> = [null, null, null, null];
-  for (let i = 0; i < 4; i++) {
-    if (adjIndex[i] !== -1 && i !== lastDir) {
-      adjPipeList[i] = pseudoAssignment[adjIndex[i]];
+  let loc = start;
+  let lastDir = -1;
+
+  while (true) {
+    const mainVar = variables[loc];
+
+    // connections, not including the pipe that came before in the path
+    let connections = connectedMask(loc, pseudoAssignment, adj);
+    if (lastDir !== -1) {
+      connections &= ~(1 << lastDir);
     }
-  }
 
-  const adjPipes: Array<Openings | null> = [
-    adjPipeList[0],
-    adjPipeList[1],
-    adjPipeList[2],
-    adjPipeList[3],
-  ];
-
-  const connections = checkConnections(mainPipe, adjPipes);
-  let numConnections = 0;
-  let curDir = 0;
-
-  for (let i = 0; i < 4; i++) {
-    if (connections[i]) {
-      numConnections++;
-      curDir = i;
+    // stop unless there is exactly one way forward
+    if (connections === 0 || (connections & (connections - 1)) !== 0) {
+      return;
     }
-  }
 
-  if (numConnections === 1) {
     // the path continues, prune from current variable
-    let pathDir = 0;
-    for (let i = 0; i < 4; i++) {
-      if (connections[i] && i !== lastDir) {
-        pathDir = i;
-        break;
-      }
-    }
+    const pathDir = 31 - Math.clz32(connections);
 
     if (mainVar.getAssignment() === null) {
-      const activeDomain = mainVar.getActiveDomain();
-      for (const assignment of activeDomain) {
-        if (!assignment[curDir] || (lastDir !== -1 && !assignment[lastDir])) {
-          toPrune.push(assignment);
-          if (pruned.has(mainVar)) {
-            pruned.get(mainVar)!.push(assignment);
-          } else {
-            pruned.set(mainVar, [assignment]);
-          }
-        }
+      // the pipe must stay open towards the rest of the path in both directions
+      let required = 1 << pathDir;
+      if (lastDir !== -1) {
+        required |= 1 << lastDir;
+      }
+
+      const removed = mainVar.activeMask & ~PIPES_WITH_OPENINGS[required];
+      if (removed !== 0) {
+        pruned.set(mainVar, (pruned.get(mainVar) ?? 0) | removed);
+        mainVar.pruneMask(removed);
       }
-      mainVar.prune(toPrune);
     }
 
-    findIsolatedPath(
-      variables,
-      pseudoAssignment,
-      adjIndex[pathDir],
-      (pathDir + 2) % 4,
-      pruned
-    );
+    loc = adj[loc * 4 + pathDir];
+    lastDir = OPPOSITE[pathDir];
   }
 }
@@ -13,6 +13,8 @@ export const noCyclesPruner = noCycles.pruner;
 // No half connections constraint
 export const noHalfConnectionsValidatorH = noHalfConnections.validatorH;
 export const noHalfConnectionsValidatorV = noHalfConnections.validatorV;
+export const noHalfConnectionsValidatorAllH = noHalfConnections.validatorAllH;
+export const noHalfConnectionsValidatorAllV = noHalfConnections.validatorAllV;
 export const noHalfConnectionsPrunerH = noHalfConnections.prunerH;
 export const noHalfConnectionsPrunerV = noHalfConnections.prunerV;
 
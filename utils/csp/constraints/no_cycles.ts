@@ -1,28 +1,46 @@
-import { Openings, Assignment, findAdj, checkConnections } from "../utils";
+import {
+  PipeType,
+  PIPES_WITH_OPENINGS,
+  adjTable,
+  connectedMask,
+} from "../utils";
 import { Variable } from "../csp";
 
+// visited bitset for assignmentHasCycle (bit loc & 31 of word loc >>> 5), kept between calls so the validator doesn't allocate
+let visitedScratch = new Uint32Array(0);
+
 function assignmentHasCycle(
-  curr: number,
-  assignment: Assignment,
-  visited: Set<number>,
-  prev: number | null = null
+  start: number,
+  assignment: ArrayLike<PipeType>,
+  adj: Int32Array
 ): boolean {
-  if (visited.has(curr)) {
-    return true;
+  const words = (assignment.length + 31) >>> 5;
+  if (visitedScratch.length !== words) {
+    visitedScratch = new Uint32Array(words);
+  } else {
+    visitedScratch.fill(0);
   }
+  const visited = visitedScratch;
+  // pairs of (location, location it was reached from)
+  const stack: number[] = [start, -1];
 
-  visited.add(curr);
-  const adjIndexes = findAdj(curr, Math.sqrt(assignment.length));
+  while (stack.length > 0) {
+    const prev = stack.pop()!;
+    const curr = stack.pop()!;
 
-  const centerPipe = assignment[curr];
-  const pipes = adjIndexes.map((i) => (i !== -1 ? assignment[i] : null));
+    // every pipe in a tree is reached exactly once, so reaching one again means there is a cycle
+    if (visited[curr >>> 5] & (1 << (curr & 31))) {
+      return true;
+    }
+    visited[curr >>> 5] |= 1 << (curr & 31);
 
-  const adjConnections = checkConnections(centerPipe, pipes);
+    const connections = connectedMask(curr, assignment, adj);
+    const base = curr * 4;
 
-  for (let i = 0; i < 4; i++) {
-    if (adjConnections[i] && adjIndexes[i] !== prev) {
-      if (assignmentHasCycle(adjIndexes[i], assignment, visited, curr)) {
-        return true;
+    for (let i = 0; i < 4; i++) {
+      const adjIndex = adj[base + i];
+      if (connections & (1 << i) && adjIndex !== prev) {
+        stack.push(adjIndex, curr);
       }
     }
   }
@@ -30,57 +48,63 @@ function assignmentHasCycle(
   return false;
 }
 
-export function validator(assignment: Assignment): boolean {
-  return !assignmentHasCycle(0, assignment, new Set<number>());
+export function validator(assignment: ArrayLike<PipeType>): boolean {
+  return !assignmentHasCycle(
+    0,
+    assignment,
+    adjTable(Math.sqrt(assignment.length))
+  );
 }
 
 function getDuplicatedTouched(
-  curr: number,
-  assignment: Array<Openings | null>,
-  visited: Set<number>,
-  touched: Map<number, number>,
-  prev: number | null = null
+  start: number,
+  assignment: Array<PipeType | null>,
+  adj: Int32Array,
+  visited: Uint8Array,
+  touched: Int32Array,
+  written: number[]
 ): [number, number, number] | null {
-  visited.add(curr);
+  // pairs of (location, location it was reached from), popped in depth-first order
+  const stack: number[] = [start, -1];
 
-  const centerPipe = assignment[curr];
-  if (centerPipe === null) {
-    throw new Error("Traversed to an unassigned pipe");
-  }
+  while (stack.length > 0) {
+    const prev = stack.pop()!;
+    const curr = stack.pop()!;
+    visited[curr] = 1;
 
-  const adjIndexes = findAdj(curr, Math.sqrt(assignment.length));
+    const centerPipe = assignment[curr];
+    if (centerPipe === null) {
+      throw new Error("Traversed to an unassigned pipe");
+    }
 
-  for (let i = 0; i < 4; i++) {
-    if (centerPipe[i]) {
-      if (adjIndexes[i] === -1) {
-        throw new Error(
-          `Pipe pointing to edge of grid in the direction of ${i}`
-        );
-      }
+    const base = curr * 4;
 
-      if (adjIndexes[i] !== prev && touched.has(adjIndexes[i])) {
-        return [adjIndexes[i], curr, touched.get(adjIndexes[i])!];
-      }
+    for (let i = 0; i < 4; i++) {
+      if (centerPipe & (1 << i)) {
+        const adjIndex = adj[base + i];
+        if (adjIndex === -1) {
+          throw new Error(
+            `Pipe pointing to edge of grid in the direction of ${i}`
+          );
+        }
 
-      touched.set(adjIndexes[i], curr);
-    }
-  }
+        if (adjIndex !== prev && touched[adjIndex] !== -1) {
+          return [adjIndex, curr, touched[adjIndex]];
+        }
 
-  const pipes = adjIndexes.map((i) => (i !== -1 ? assignment[i] : null));
-  const adjConnections = checkConnections(centerPipe, pipes);
+        if (touched[adjIndex] === -1) {
+          written.push(adjIndex);
+        }
+        touched[adjIndex] = curr;
+      }
+    }
 
-  for (let i = 0; i < 4; i++) {
-    if (adjConnections[i] && adjIndexes[i] !== prev) {
-      const duplicateTouch = getDuplicatedTouched(
-        adjIndexes[i],
-        assignment,
-        visited,
-        touched,
-        curr
-      );
+    const connections = connectedMask(curr, assignment, adj);
 
-      if (duplicateTouch) {
-        return duplicateTouch;
+    // push in reverse so neighbors are explored in direction order
+    for (let i = 3; i >= 0; i--) {
+      if (connections & (1 << i) && adj[base + i] !== prev) {
+        stack.push(adj[base + i], curr);
       }
     }
   }
@@ -88,13 +112,16 @@ function getDuplicatedTouched(
   return null;
 }
 
-export function pruner(variables: Variable[]): Map<Variable, Openings[]> {
-  const assignment: Array<Openings | null> = variables.map((v) =>
+export function pruner(variables: Variable[]): Map<Variable, number> {
+  const assignment: Array<PipeType | null> = variables.map((v) =>
     v.getAssignment()
   );
-  const n = Math.sqrt(assignment.length);
+  const adj = adjTable(Math.sqrt(assignment.length));
 
-  const visited: Set<number> = new Set();
+  // which pipe last touched each location, and the locations set by the current traversal so only those are reset
+  const touched = new Int32Array(assignment.length).fill(-1);
+  const written: number[] = [];
+  const visited = new Uint8Array(assignment.length);
   for (
     let assignmentIndex = 0;
     assignmentIndex < assignment.length;
@@ -102,53 +129,56 @@ export function pruner(variables: Variable[]): Map<Variable, Openings[]> {
   ) {
     const assignmentValue = assignment[assignmentIndex];
 
-    if (assignmentValue !== null && !visited.has(assignmentIndex)) {
+    if (assignmentValue !== null && !visited[assignmentIndex]) {
       const duplicateTouch = getDuplicatedTouched(
         assignmentIndex,
         assignment,
+        adj,
         visited,
-        new Map<number, number>()
+        touched,
+        written
       );
 
       if (duplicateTouch) {
-        const variableToPrune = variables.find(
-          (v) => v.location === duplicateTouch[0]
-        );
-
-        if (!variableToPrune) continue;
-
-        const [top, right, bottom, left] = findAdj(duplicateTouch[0], n);
-        const directions = [top, right, bottom, left];
-        const touches = [duplicateTouch[1], duplicateTouch[2]];
-        const touchedDirections: number[] = [];
-
-        for (let i = 0; i < directions.length; i++) {
-          for (const touchValue of touches) {
-            if (directions[i] === touchValue) {
-              touchedDirections.push(i);
-            }
-          }
+        // variables are created in location order, so the location is also the index
+        const variableToPrune = variables[duplicateTouch[0]];
+        if (
+          process.env.NODE_ENV !== "production" &&
+          variableToPrune.location !== duplicateTouch[0]
+        ) {
+          throw new Error("Variables are not ordered by location");
         }
 
-        const prunedValues: Openings[] = [];
-        for (const activeDomain of variableToPrune.getActiveDomain()) {
+        // the directions of the two pipes that both touch it
+        const base = duplicateTouch[0] * 4;
+        let touchedMask = 0;
+        for (let i = 0; i < 4; i++) {
+          const adjIndex = adj[base + i];
           if (
-            activeDomain[touchedDirections[0]] &&
-            activeDomain[touchedDirections[1]]
+            adjIndex === duplicateTouch[1] ||
+            adjIndex === duplicateTouch[2]
           ) {
-            prunedValues.push(activeDomain);
+            touchedMask |= 1 << i;
           }
         }
+        const removed =
+          variableToPrune.activeMask & PIPES_WITH_OPENINGS[touchedMask];
 
-        const prunedDict = new Map<Variable, Openings[]>();
-        prunedDict.set(variableToPrune, prunedValues);
-
-        variableToPrune.prune(prunedValues);
+        const prunedDict = new Map<Variable, number>();
+        if (removed !== 0) {
+          prunedDict.set(variableToPrune, removed);
+          variableToPrune.pruneMask(removed);
+        }
 
         return prunedDict;
       }
+
+      for (const loc of written) {
+        touched[loc] = -1;
+      }
+      written.length = 0;
     }
   }
 
-  return new Map<Variable, Openings[]>();
+  return new Map<Variable, number>();
 }
@@ -1,74 +1,120 @@
-import { Openings } from "../utils";
+import {
+  PipeType,
+  PIPE_TOP,
+  PIPE_RIGHT,
+  PIPE_BOTTOM,
+  PIPE_LEFT,
+  PIPES_WITH_OPENINGS,
+} from "../utils";
 import { Variable } from "../csp";
 
 /**
  * Ensures that two horizontally-adjacent pipes are not blocking each other
  * @param pipes A tuple of two pipes. pipes[0] is the one on the left, pipes[1] is the one on the right
  */
-export function validatorH(pipes: Openings[]): boolean {
+export function validatorH(pipes: PipeType[]): boolean {
   const left = pipes[0];
   const right = pipes[1];
   // check if the left pipe's right opening is the same as the right pipe's left opening
-  return left[1] === right[3];
+  return Boolean(left & PIPE_RIGHT) === Boolean(right & PIPE_LEFT);
 }
 
 /**
  * Ensures that two vertically-adjacent pipes are not blocking each other
  * @param pipes A tuple of two pipes. pipes[0] is the one above, pipes[1] is the one below
  */
-export function validatorV(pipes: Openings[]): boolean {
+export function validatorV(pipes: PipeType[]): boolean {
   const above = pipes[0];
   const below = pipes[1];
   // check if the top pipe's bottom opening is the same as the bottom pipe's top opening
-  return above[2] === below[0];
+  return Boolean(above & PIPE_BOTTOM) === Boolean(below & PIPE_TOP);
+}
+
+/**
+ * Ensures that no two horizontally-adjacent pipes in a whole grid are blocking each other
+ * @param pipes The assignment of every pipe in the grid
+ */
+export function validatorAllH(pipes: ArrayLike<PipeType>): boolean {
+  const n = Math.sqrt(pipes.length);
+  let mismatched = 0;
+  for (let row = 0; row < pipes.length; row += n) {
+    for (let loc = row; loc < row + n - 1; loc++) {
+      // the left pipe's right opening (bit 1) must match the right pipe's left opening (bit 3)
+      mismatched |= (pipes[loc] >> 1) ^ (pipes[loc + 1] >> 3);
+    }
+  }
+  return (mismatched & 1) === 0;
+}
+
+/**
+ * Ensures that no two vertically-adjacent pipes in a whole grid are blocking each other
+ * @param pipes The assignment of every pipe in the grid
+ */
+export function validatorAllV(pipes: ArrayLike<PipeType>): boolean {
+  const n = Math.sqrt(pipes.length);
+  let mismatched = 0;
+  for (let loc = 0; loc < pipes.length - n; loc++) {
+    // the top pipe's bottom opening (bit 2) must match the bottom pipe's top opening (bit 0)
+    mismatched |= (pipes[loc] >> 2) ^ pipes[loc + n];
+  }
+  return (mismatched & 1) === 0;
+}
+
+/**
+ * Prunes every value in mask from a variable's active domain, recording the mask of values that were removed
+ */
+function pruneFrom(
+  variable: Variable,
+  mask: number,
+  toPrune: Map<Variable, number>
+): void {
+  const removed = variable.activeMask & mask;
+  if (removed !== 0) {
+    toPrune.set(variable, removed);
+    variable.pruneMask(removed);
+  }
 }
 
 /**
  * Prunes values from 2 variables that would result in one of the pipes being blocked by an exit of another pipe
  * @param pipes Tuple of two pipes where pipes[0] is to the left of pipes[1]
- * @returns A map of the variables to the values to remove from their active domain
+ * @returns A map of the variables to the mask of values removed from their active domain
  */
-export function prunerH(pipes: Variable[]): Map<Variable, Openings[]> {
+export function prunerH(pipes: Variable[]): Map<Variable, number> {
   const left = pipes[0];
   const right = pipes[1];
 
   const leftAssignment = left.getAssignment();
   const rightAssignment = right.getAssignment();
 
-  const toPrune = new Map<Variable, Openings[]>();
-
-  if (leftAssignment !== null && rightAssignment === null) {
-    for (const pipeType of right.getActiveDomain()) {
-      // there is a path to the right pipe, prune all PipeTypes for the right pipe where the pipe doesn't connect with the left
-      // or
-      // there is no path to the right pipe, prune all PipeTypes for the right pipe where the pipe tries to connect with the left pipe
-      if (leftAssignment[1] !== pipeType[3]) {
-        if (toPrune.has(right)) {
-          toPrune.get(right)!.push(pipeType);
-        } else {
-          toPrune.set(right, [pipeType]);
-        }
-      }
-    }
-  } else if (rightAssignment !== null && leftAssignment === null) {
-    for (const pipeType of left.getActiveDomain()) {
-      // there is a path to the left pipe, prune all PipeTypes for the left pipe where the pipe doesn't connect with the right
-      // or
-      // there is no path to the left pipe, prune all PipeTypes for the left pipe where the pipe tries to connect with the right pipe
-      if (rightAssignment[3] !== pipeType[1]) {
-        if (toPrune.has(left)) {
-          toPrune.get(left)!.push(pipeType);
-        } else {
-          toPrune.set(left, [pipeType]);
-        }
-      }
-    }
-  }
+  const toPrune = new Map<Variable, number>();
 
   // if there are no assignments for either pipe, nothing should be pruned.
   // if both pipes are assigned, don't prune
-  for (const [variable, prunedValues] of toPrune.entries()) {
-    variable.prune(prunedValues);
+  if ((leftAssignment === null) === (rightAssignment === null)) {
+    return toPrune;
+  }
+
+  if (leftAssignment !== null && rightAssignment === null) {
+    // there is a path to the right pipe, prune all PipeTypes for the right pipe where the pipe doesn't connect with the left
+    // or
+    // there is no path to the right pipe, prune all PipeTypes for the right pipe where the pipe tries to connect with the left pipe
+    const opensLeft = PIPES_WITH_OPENINGS[PIPE_LEFT];
+    pruneFrom(
+      right,
+      leftAssignment & PIPE_RIGHT ? ~opensLeft : opensLeft,
+      toPrune
+    );
+  } else if (rightAssignment !== null && leftAssignment === null) {
+    // there is a path to the left pipe, prune all PipeTypes for the left pipe where the pipe doesn't connect with the right
+    // or
+    // there is no path to the left pipe, prune all PipeTypes for the left pipe where the pipe tries to connect with the right pipe
+    const opensRight = PIPES_WITH_OPENINGS[PIPE_RIGHT];
+    pruneFrom(
+      left,
+      rightAssignment & PIPE_LEFT ? ~opensRight : opensRight,
+      toPrune
+    );
   }
 
   return toPrune;
@@ -77,49 +123,43 @@ export function prunerH(pipes: Variable[]): Map<Variable, Openings[]> {
 /**
  * Prunes values from 2 variables that would result in one of the pipes being blocked by an exit of another pipe
  * @param pipes Tuple of two pipes where pipes[0] is above pipes[1]
- * @returns A map of the variables to the values to remove from their active domain
+ * @returns A map of the variables to the mask of values removed from their active domain
  */
-export function prunerV(pipes: Variable[]): Map<Variable, Openings[]> {
+export function prunerV(pipes: Variable[]): Map<Variable, number> {
   const top = pipes[0];
   const bottom = pipes[1];
 
   const topAssignment = top.getAssignment();
   const bottomAssignment = bottom.getAssignment();
 
-  const toPrune = new Map<Variable, Openings[]>();
-
-  if (topAssignment !== null && bottomAssignment === null) {
-    for (const pipeType of bottom.getActiveDomain()) {
-      // there is a path to the bottom pipe, prune all PipeTypes for the bottom pipe where the pipe doesn't connect with the top
-      // or
-      // there is no path to the bottom pipe, prune all PipeTypes for the bottom pipe where the pipe tries to connect with the top pipe
-      if (topAssignment[2] !== pipeType[0]) {
-        if (toPrune.has(bottom)) {
-          toPrune.get(bottom)!.push(pipeType);
-        } else {
-          toPrune.set(bottom, [pipeType]);
-        }
-      }
-    }
-  } else if (bottomAssignment !== null && topAssignment === null) {
-    for (const pipeType of top.getActiveDomain()) {
-      // there is a path to the top pipe, prune all PipeTypes for the top pipe where the pipe doesn't connect with the bottom
-      // or
-      // there is no path to the top pipe, prune all PipeTypes for the top pipe where the pipe tries to connect with the bottom pipe
-      if (bottomAssignment[0] !== pipeType[2]) {
-        if (toPrune.has(top)) {
-          toPrune.get(top)!.push(pipeType);
-        } else {
-          toPrune.set(top, [pipeType]);
-        }
-      }
-    }
-  }
+  const toPrune = new Map<Variable, number>();
 
   // if there are no assignments for either pipe, nothing should be pruned.
   // if both pipes are assigned, don't prune
-  for (const [variable, prunedValues] of toPrune.entries()) {
-    variable.prune(prunedValues);
+  if ((topAssignment === null) === (bottomAssignment === null)) {
+    return toPrune;
+  }
+
+  if (topAssignment !== null && bottomAssignment === null) {
+    // there is a path to the bottom pipe, prune all PipeTypes for the bottom pipe where the pipe doesn't connect with the top
+    // or
+    // there is no path to the bottom pipe, prune all PipeTypes for the bottom pipe where the pipe tries to connect with the top pipe
+    const opensTop = PIPES_WITH_OPENINGS[PIPE_TOP];
+    pruneFrom(
+      bottom,
+      topAssignment & PIPE_BOTTOM ? ~opensTop : opensTop,
+      toPrune
+    );
+  } else if (bottomAssignment !== null && topAssignment === null) {
+    // there is a path to the top pipe, prune all PipeTypes for the top pipe where the pipe doesn't connect with the bottom
+    // or
+    // there is no path to the top pipe, prune all PipeTypes for the top pipe where the pipe tries to connect with the bottom pipe
+    const opensBottom = PIPES_WITH_OPENINGS[PIPE_BOTTOM];
+    pruneFrom(
+      top,
+      bottomAssignment & PIPE_TOP ? ~opensBottom : opensBottom,
+      toPrune
+    );
   }
 
   return toPrune;
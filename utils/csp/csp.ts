@@ -1,48 +1,60 @@
 // Implementation of CSP with iterative algorithms for better performance
 
-import { Openings, Assignment, findAdj, printPipesGrid } from "./utils";
-
-type Validator = (pipes: Openings[]) => boolean;
-type Pruner = (scope: Variable[]) => Map<Variable, Openings[]>;
+import {
+  PipeType,
+  Assignment,
+  adjTable,
+  printPipesGrid,
+  pipesToDomainMask,
+  domainMaskToPipes,
+  popcount,
+} from "./utils";
+
+type Validator = (pipes: PipeType[]) => boolean;
+// pruners return the mask of values they removed from each variable's active domain
+type Pruner = (scope: Variable[]) => Map<Variable, number>;
 
 export class Variable {
   location: number;
-  domain: Openings[];
-  activeDomain: Openings[];
-  assignment: Openings | null = null;
+  domain: readonly PipeType[];
+  // bit p is set for every PipeType p in the domain
+  domainMask: number;
+  // bit p is set while PipeType p is in the active domain
+  activeMask: number;
+  assignment: PipeType | null = null;
 
   constructor(
     location: number,
-    domain: Openings[] = [],
-    assignment: Openings | null = null
+    domain: readonly PipeType[] = [],
+    assignment: PipeType | null = null
   ) {
     this.location = location;
     this.domain = domain;
-    this.activeDomain = [...domain];
+    this.domainMask = pipesToDomainMask(domain);
+    this.activeMask = this.domainMask;
     if (assignment !== null) {
       this.assign(assignment);
     }
   }
 
-  getActiveDomain(): Openings[] {
-    return [...this.activeDomain];
+  getActiveDomain(): PipeType[] {
+    return domainMaskToPipes(this.activeMask);
   }
 
-  getAssignment(): Openings | null {
+  getAssignment(): PipeType | null {
     return this.assignment;
   }
 
-  prune(toRemove: Openings[]): void {
-    for (const p of toRemove) {
-      const idx = this.activeDomain.findIndex((d) =>
-        d.every((b, i) => b === p[i])
-      );
-      if (idx >= 0) this.activeDomain.splice(idx, 1);
-    }
+  prune(toRemove: PipeType[]): void {
+    this.pruneMask(pipesToDomainMask(toRemove));
+  }
+
+  pruneMask(toRemove: number): void {
+    this.activeMask &= ~toRemove;
   }
 
-  assign(value: Openings): boolean {
-    if (!this.domain.some((d) => d.every((b, i) => b === value[i]))) {
+  assign(value: PipeType): boolean {
+    if ((this.domainMask & (1 << value)) === 0) {
       console.error("Attempted to assign variable to value not in domain");
       return false;
     }
@@ -59,35 +71,40 @@ export class Variable {
   }
 
   toString(): string {
-    const ass = this.assignment
-      ? `[${this.assignment.join(",")}]`
-      : "Unassigned";
-    return `Variable ${this.location}: ${ass} in [${this.activeDomain
-      .map((d) => "[" + d.join(",") + "]")
-      .join(", ")}]`;
+    const ass = this.assignment !== null ? `${this.assignment}` : "Unassigned";
+    const active = this.getActiveDomain().join(", ");
+    return `Variable ${this.location}: ${ass} in [${active}]`;
   }
 }
 
 export class Constraint {
-  name: string;
+  // names are only needed for debugging, so they can be given as a function that is called the first time the name is read
+  private lazyName: string | (() => string);
   private validator: Validator;
   private pruner: Pruner;
   scope: Variable[];
 
   constructor(
-    name: string,
+    name: string | (() => string),
     validator: Validator,
     pruner: Pruner,
     scope: Variable[]
   ) {
-    this.name = name;
+    this.lazyName = name;
     this.validator = validator;
     this.pruner = pruner;
     this.scope = scope;
   }
 
+  get name(): string {
+    if (typeof this.lazyName !== "string") {
+      this.lazyName = this.lazyName();
+    }
+    return this.lazyName;
+  }
+
   varHasActiveDomains(): boolean {
-    return this.scope.every((v) => v.activeDomain.length > 0);
+    return this.scope.every((v) => v.activeMask !== 0);
   }
 
   checkFullyAssigned(): boolean {
@@ -100,11 +117,11 @@ export class Constraint {
         "Tried to check if a constraint with unassigned variables was violated"
       );
     }
-    const pipes = this.scope.map((v) => v.getAssignment()!) as Openings[];
+    const pipes = this.scope.map((v) => v.getAssignment()!) as PipeType[];
     return !this.validator(pipes);
   }
 
-  prune(): Map<Variable, Openings[]> {
+  prune(): Map<Variable, number> {
     return this.pruner(this.scope);
   }
 
@@ -113,14 +130,6 @@ export class Constraint {
   }
 }
 
-// Interface for stack frames in the iterative gacAll implementation
-interface GacStackFrame {
-  currVar: Variable;
-  domainIndex: number;
-  active: Openings[];
-  backup: Map<Variable, Openings[]>;
-}
-
 export class CSP {
   name: string;
   vars: Variable[] = [];
@@ -128,11 +137,18 @@ export class CSP {
   varsToCons: Map<Variable, Constraint[]> = new Map();
   assignedVars: Variable[] = [];
   unassignedVars: Variable[] = [];
+  // position of each variable in whichever of assignedVars and unassignedVars holds it
+  private varIndex: Map<Variable, number> = new Map();
+  // size of the grid and its adjacency table, fixed once the variables are added
+  private n: number;
+  private adj: Int32Array;
 
   constructor(name: string, vars: Variable[], cons: Constraint[]) {
     this.name = name;
     for (const v of vars) this.addVar(v);
     for (const c of cons) this.addCon(c);
+    this.n = Math.sqrt(this.vars.length) | 0;
+    this.adj = adjTable(this.n);
   }
 
   addVar(v: Variable): void {
@@ -140,9 +156,9 @@ export class CSP {
       this.vars.push(v);
       this.varsToCons.set(v, []);
       if (v.getAssignment() === null) {
-        this.unassignedVars.push(v);
+        this.varIndex.set(v, this.unassignedVars.push(v) - 1);
       } else {
-        this.assignedVars.push(v);
+        this.varIndex.set(v, this.assignedVars.push(v) - 1);
       }
     }
   }
@@ -170,14 +186,18 @@ export class CSP {
     return [...this.vars];
   }
 
-  getConsWithVar(v: Variable): Constraint[] {
-    return [...(this.varsToCons.get(v) || [])];
+  // returns the CSP's own list rather than a copy, so it is read-only
+  getConsWithVar(v: Variable): readonly Constraint[] {
+    return this.varsToCons.get(v) || [];
   }
 
-  assignVar(v: Variable, val: Openings): boolean {
+  assignVar(v: Variable, val: PipeType): boolean {
+    const wasUnassigned = v.getAssignment() === null;
     if (v.assign(val)) {
-      this.unassignedVars = this.unassignedVars.filter((x) => x !== v);
-      this.assignedVars.push(v);
+      if (wasUnassigned) {
+        this.swapRemove(this.unassignedVars, v);
+        this.varIndex.set(v, this.assignedVars.push(v) - 1);
+      }
       return true;
     }
     return false;
@@ -185,48 +205,69 @@ export class CSP {
 
   unassignVar(v: Variable): boolean {
     if (v.unassign()) {
-      this.unassignedVars.push(v);
-      this.assignedVars = this.assignedVars.filter((x) => x !== v);
+      this.swapRemove(this.assignedVars, v);
+      this.varIndex.set(v, this.unassignedVars.push(v) - 1);
       return true;
     }
     return false;
   }
 
+  /**
+   * Removes a variable from assignedVars or unassignedVars in constant time by moving the last variable into its place
+   * @param list The list holding the variable
+   * @param v The variable to remove
+   */
+  private swapRemove(list: Variable[], v: Variable): void {
+    const i = this.varIndex.get(v)!;
+    const last = list.pop()!;
+    if (last !== v) {
+      list[i] = last;
+      this.varIndex.set(last, i);
+    }
+  }
+
   getAssignment(): Assignment {
-    return this.vars.map((v) => {
-      const a = v.getAssignment();
+    const assignment = new Uint8Array(this.vars.length);
+    for (let i = 0; i < this.vars.length; i++) {
+      const a = this.vars[i].getAssignment();
       if (a === null) {
         throw new Error(
           "Tried to get assignment when some variables are unassigned"
         );
       }
-      return a;
-    });
+      assignment[i] = a;
+    }
+    return assignment;
   }
 
-  // Optimized implementation of ac3
-  ac3(queue: Constraint[]): Map<Variable, Openings[]> {
-    const prunedAll = new Map<Variable, Openings[]>();
+  // Optimized implementation of ac3, returns a mask of the values pruned from each variable
+  ac3(queue: readonly Constraint[]): Map<Variable, number> {
+    const prunedAll = new Map<Variable, number>();
     const queueCopy = [...queue]; // Create a copy to avoid modifying the original
+    // constraints still waiting in the queue, the queue itself is consumed by moving head forward
+    const inQueue = new Set(queueCopy);
 
-    while (queueCopy.length > 0) {
-      const con = queueCopy.shift()!;
+    for (let head = 0; head < queueCopy.length; head++) {
+      const con = queueCopy[head];
+      inQueue.delete(con);
       const pruned = con.prune();
 
       for (const [v, rem] of pruned.entries()) {
-        if (!prunedAll.has(v)) {
-          prunedAll.set(v, []);
+        // only requeue constraints for variables whose domain actually shrank
+        if (rem === 0) {
+          continue;
         }
 
-        prunedAll.get(v)!.push(...rem);
+        prunedAll.set(v, (prunedAll.get(v) ?? 0) | rem);
 
-        if (v.getActiveDomain().length === 0) {
+        if (v.activeMask === 0) {
           return prunedAll;
         }
 
         // Add all constraints containing the modified variable to the queue
         for (const c of this.getConsWithVar(v)) {
-          if (!queueCopy.includes(c)) {
+          if (!inQueue.has(c)) {
+            inQueue.add(c);
             queueCopy.push(c);
           }
         }
@@ -240,206 +281,213 @@ export class CSP {
     solutions: Set<string>,
     maxSolutions: number = -1,
     printSolutions: boolean = false,
-    randomStart: boolean = false
+    randomStart: boolean = false,
+    preprocess: boolean = false
   ): number {
-    // Stack to track search state
+    if (maxSolutions !== -1 && solutions.size >= maxSolutions) {
+      return solutions.size;
+    }
+
+    for (const currAssignment of this.gacIter(randomStart, preprocess)) {
+      // serialized as a plain array of pipes, not as a typed array object
+      const solutionStr = JSON.stringify(Array.from(currAssignment));
+      if (!solutions.has(solutionStr)) {
+        solutions.add(solutionStr);
+        if (printSolutions) {
+          printPipesGrid(currAssignment, this.n);
+          console.log(solutions.size);
+          console.log();
+        }
+      }
+
+      // Check if max solutions reached
+      if (maxSolutions !== -1 && solutions.size >= maxSolutions) {
+        break;
+      }
+    }
+
+    return solutions.size;
+  }
+
+  /**
+   * Searches for solutions, yielding each one as soon as it is found so callers that need only a few can stop early
+   * @param randomStart Whether to randomize the order variables and values are tried in
+   * @param preprocess Whether to make every constraint arc consistent before searching
+   * @returns A generator of complete assignments that satisfy every constraint
+   */
+  *gacIter(
+    randomStart: boolean = false,
+    preprocess: boolean = false
+  ): Generator<Assignment> {
+    // one frame per assigned variable, in the order they were assigned
     interface SearchState {
       variable: Variable;
       domainIndex: number;
-      activeDomain: Openings[];
-      pruned: Map<Variable, Openings[]>;
+      activeDomain: PipeType[];
+      // mask of the values pruned from each variable by the current assignment
+      pruned: Map<Variable, number>;
     }
 
     const stack: SearchState[] = [];
+    // assignVar and unassignVar update this list in place
+    const unassignedVars = this.unassignedVars;
 
-    // Initial state
-    if (this.unassignedVars.length > 0) {
-      const initialVar = this.manhattanDistToConnection(randomStart);
-      const activeDomain = [...initialVar.getActiveDomain()];
+    const pushState = (): void => {
+      const variable = this.manhattanDistToConnection(randomStart);
+      const activeDomain = variable.getActiveDomain();
       if (randomStart) {
         this.shuffle(activeDomain);
       }
+      stack.push({ variable, domainIndex: 0, activeDomain, pruned: new Map() });
+    };
 
-      if (activeDomain.length > 0) {
-        stack.push({
-          variable: initialVar,
-          domainIndex: 0,
-          activeDomain,
-          pruned: new Map(),
-        });
+    // undo the assignment of a state and move it on to its next value
+    const advance = (state: SearchState): void => {
+      this.unassignVar(state.variable);
+      for (const [var_, removed] of state.pruned) {
+        var_.activeMask |= removed;
+      }
+      state.pruned = new Map();
+      state.domainIndex++;
+    };
+
+    // make every constraint arc consistent once before searching, restored when the search ends
+    const preprocessed = preprocess
+      ? this.ac3(this.cons)
+      : new Map<Variable, number>();
+    let solvable = true;
+    for (const var_ of preprocessed.keys()) {
+      if (var_.activeMask === 0) {
+        solvable = false;
+        break;
       }
     }
 
-    while (stack.length > 0) {
-      // Check if max solutions reached
-      if (maxSolutions !== -1 && solutions.size >= maxSolutions) {
-        return solutions.size;
+    // the caller may stop early (gacAll at maxSolutions, or a single next()), so undo everything the search did on every exit
+    try {
+      if (solvable && unassignedVars.length > 0) {
+        pushState();
       }
 
-      // If no unassigned vars, we have a solution
-      if (this.unassignedVars.length === 0) {
-        const currAssignment = this.getAssignment();
-        const solutionStr = JSON.stringify(currAssignment);
-
-        if (!solutions.has(solutionStr)) {
-          // Verify no constraints are violated
-          let valid = true;
-          for (const con of this.cons) {
-            if (con.violated()) {
-              valid = false;
-              break;
-            }
-          }
-
-          if (valid) {
-            solutions.add(solutionStr);
-            if (printSolutions) {
-              printPipesGrid(currAssignment);
-              console.log(solutions.size);
-              console.log();
-            }
-          }
-        }
-
-        // Backtrack to try next value
+      while (stack.length > 0) {
         const state = stack[stack.length - 1];
-        this.unassignVar(state.variable);
 
-        // Restore pruned domains
-        for (const [var_, pruned] of state.pruned.entries()) {
-          var_.activeDomain.push(...pruned);
+        // If no unassigned vars, we have a solution
+        if (unassignedVars.length === 0) {
+          // every constraint was pruned for as its variables were assigned, so a complete assignment can't violate one
+          yield this.getAssignment();
+          advance(state);
+          continue;
         }
 
-        // Move to next value in domain
-        state.domainIndex++;
-        state.pruned = new Map();
-
-        // If we've tried all values, pop the state
+        // If we've tried all values in the domain, backtrack
         if (state.domainIndex >= state.activeDomain.length) {
           stack.pop();
+          if (stack.length > 0) {
+            advance(stack[stack.length - 1]);
+          }
+          continue;
         }
 
-        continue;
-      }
-
-      // Get current state
-      const state = stack[stack.length - 1];
+        // Try current value in domain
+        this.assignVar(state.variable, state.activeDomain[state.domainIndex]);
+        state.pruned = this.ac3(this.getConsWithVar(state.variable));
 
-      // If we've tried all values in the domain, backtrack
-      if (state.domainIndex >= state.activeDomain.length) {
-        stack.pop();
-
-        // If stack not empty, restore variable and prepare for next value
-        if (stack.length > 0) {
-          const prevState = stack[stack.length - 1];
-          this.unassignVar(prevState.variable);
-
-          // Restore pruned domains
-          for (const [var_, pruned] of prevState.pruned.entries()) {
-            var_.activeDomain.push(...pruned);
+        // Check if assignment leads to a dead end
+        let noActiveDomains = false;
+        for (const var_ of state.pruned.keys()) {
+          if (var_.activeMask === 0) {
+            noActiveDomains = true;
+            break;
           }
-
-          // Move to next value
-          prevState.domainIndex++;
-          prevState.pruned = new Map();
         }
 
-        continue;
-      }
-
-      // Try current value in domain
-      const assignment = state.activeDomain[state.domainIndex];
-
-      // Ensure variable is unassigned before assigning
-      this.unassignVar(state.variable);
-      this.assignVar(state.variable, assignment);
-
-      // Check if assignment leads to a dead end
-      const prunedDomains = this.ac3(this.getConsWithVar(state.variable));
-      let noActiveDomains = false;
-
-      for (const [var_, pruned] of prunedDomains.entries()) {
-        if (var_.getActiveDomain().length === 0) {
-          noActiveDomains = true;
-          break;
+        if (noActiveDomains) {
+          advance(state);
+        } else if (unassignedVars.length > 0) {
+          // Move deeper in search tree
+          pushState();
         }
+        // If unassignedVars is empty, loop will continue to solution handling
       }
-
-      // Update pruned domains in current state
-      state.pruned = prunedDomains;
-
-      if (noActiveDomains) {
-        // Restore domains and try next value
-        for (const [var_, pruned] of prunedDomains.entries()) {
-          var_.activeDomain.push(...pruned);
-        }
-        state.domainIndex++;
-        state.pruned = new Map();
-      } else if (this.unassignedVars.length > 0) {
-        // Move deeper in search tree
-        const nextVar = this.manhattanDistToConnection(randomStart);
-        const nextActiveDomain = [...nextVar.getActiveDomain()];
-
-        if (randomStart) {
-          this.shuffle(nextActiveDomain);
+    } finally {
+      while (stack.length > 0) {
+        const state = stack.pop()!;
+        this.unassignVar(state.variable);
+        for (const [var_, removed] of state.pruned) {
+          var_.activeMask |= removed;
         }
+      }
 
-        stack.push({
-          variable: nextVar,
-          domainIndex: 0,
-          activeDomain: nextActiveDomain,
-          pruned: new Map(),
-        });
+      for (const [var_, removed] of preprocessed) {
+        var_.activeMask |= removed;
       }
-      // If unassignedVars is empty, loop will continue to solution handling
     }
-
-    return solutions.size;
   }
 
   manhattanDistToConnection(randomizeOrder: boolean): Variable {
-    const n = Math.sqrt(this.vars.length) | 0;
-    const locPipe = new Map<number, Openings>();
+    const n = this.n;
+    const adj = this.adj;
+    const assignedLocs = new Set<number>();
     for (const v of this.assignedVars) {
-      locPipe.set(v.location, v.getAssignment()!);
+      assignedLocs.add(v.location);
     }
     const unassignedLocs: number[] = [];
     const locVar = new Map<number, Variable>();
-    for (const v of this.unassignedVars) {
+    // scan in location order, unassignedVars is kept in no particular order
+    for (const v of this.vars) {
+      if (v.getAssignment() !== null) {
+        continue;
+      }
       unassignedLocs.push(v.location);
       locVar.set(v.location, v);
     }
 
     const direct = new Set<number>();
-    for (const [loc, pipe] of locPipe) {
-      const [up, right, down, left] = findAdj(loc, n);
-      const neighbors: (Openings | null)[] = [
-        up >= 0 && locPipe.has(up) ? locPipe.get(up)! : null,
-        right >= 0 && locPipe.has(right) ? locPipe.get(right)! : null,
-        down >= 0 && locPipe.has(down) ? locPipe.get(down)! : null,
-        left >= 0 && locPipe.has(left) ? locPipe.get(left)! : null,
-      ];
-      [up, right, down, left].forEach((idx, i) => {
-        if (idx !== -1 && neighbors[i] === null) direct.add(idx);
-      });
+    for (const loc of assignedLocs) {
+      const base = loc * 4;
+      for (let i = 0; i < 4; i++) {
+        const adjIndex = adj[base + i];
+        if (adjIndex !== -1 && !assignedLocs.has(adjIndex)) {
+          direct.add(adjIndex);
+        }
+      }
+    }
+
+    // multi-source bfs from the direct connections, on an open grid this is the manhattan distance to the nearest one
+    const dist = new Int32Array(n * n).fill(2 * n);
+    const queue: number[] = [];
+    for (const conn of direct) {
+      dist[conn] = 0;
+      queue.push(conn);
+    }
+    for (let head = 0; head < queue.length; head++) {
+      const loc = queue[head];
+      for (let i = 0; i < 4; i++) {
+        const adjIndex = adj[loc * 4 + i];
+        if (adjIndex !== -1 && dist[adjIndex] === 2 * n) {
+          dist[adjIndex] = dist[loc] + 1;
+          queue.push(adjIndex);
+        }
+      }
     }
 
-    const distMap = new Map<number, number[]>();
-    let lowest = 2 * n;
+    // fewest remaining values first, then closest to a connection
+    let choices: number[] = [];
+    let lowestSize = Infinity;
+    let lowest = Infinity;
     for (const loc of unassignedLocs) {
-      let minD = 2 * n;
-      for (const conn of direct) {
-        const dx = Math.abs((loc % n) - (conn % n));
-        const dy = Math.abs(Math.floor(loc / n) - Math.floor(conn / n));
-        minD = Math.min(minD, dx + dy);
+      const size = popcount(locVar.get(loc)!.activeMask);
+      const minD = dist[loc];
+      if (size < lowestSize || (size === lowestSize && minD < lowest)) {
+        choices = [loc];
+        lowestSize = size;
+        lowest = minD;
+      } else if (size === lowestSize && minD === lowest) {
+        choices.push(loc);
       }
-      if (!distMap.has(minD)) distMap.set(minD, []);
-      distMap.get(minD)!.push(loc);
-      lowest = Math.min(lowest, minD);
-      if (minD === 0) break;
     }
 
-    const choices = distMap.get(lowest)!;
     const pick =
       randomizeOrder && choices.length > 1
         ? choices[Math.floor(Math.random() * choices.length)]
@@ -447,10 +495,13 @@ export class CSP {
     return locVar.get(pick)!;
   }
 
+  // shuffles in place, only ever called on a fresh copy of a variable's active domain
   private shuffle<T>(arr: T[]): void {
     for (let i = arr.length - 1; i > 0; i--) {
       const j = Math.floor(Math.random() * (i + 1));
-      [arr[i], arr[j]] = [arr[j], arr[i]];
+      const tmp = arr[i];
+      arr[i] = arr[j];
+      arr[j] = tmp;
     }
   }
 }
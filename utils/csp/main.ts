@@ -1,19 +1,26 @@
 import { createPipesCSP } from "./combined";
-import { Openings } from "./utils";
+import { PipeType } from "./utils";
+
+// the state string of every PipeType, where character i is 1 if the pipe opens in direction i
+const PIPE_STATE_STR: readonly string[] = Array.from(
+  { length: 16 },
+  (_, pipe) => {
+    let str = "";
+    for (let dir = 0; dir < 4; dir++) {
+      str += pipe & (1 << dir) ? "1" : "0";
+    }
+    return str;
+  }
+);
 
 /**
  * Generates a string representation of a pipe state
  * @param state An array of PipeType objects representing the puzzle state
  * @returns A string of 0s and 1s representing the state
  */
-function generateOneStateStr(state: Openings[]): string {
-  let output = "";
-  for (const pipe of state) {
-    for (let dir = 0; dir < 4; dir++) {
-      output += pipe[dir] ? "1" : "0";
-    }
-  }
-  return output;
+function generateOneStateStr(state: ArrayLike<PipeType>): string {
+  // joined once rather than appended to, so the string is built flat instead of as a chain of concatenations
+  return Array.from(state, (pipe) => PIPE_STATE_STR[pipe]).join("");
 }
 
 /**
@@ -27,18 +34,13 @@ export async function generateSolution(n: number): Promise<string> {
       // Create CSP
       const csp = createPipesCSP(n);
 
-      // Find single solution using GAC
-      const solutions = new Set<string>();
-      csp.gacAll(solutions, 1, false, true);
-
-      // Get the solution
-      if (solutions.size > 0) {
-        const solutionArr = Array.from(solutions);
-        const solution = JSON.parse(solutionArr[0]);
+      // Find single solution using GAC, returning from the loop closes the search so it restores the CSP
+      for (const solution of csp.gacIter(true)) {
         resolve(generateOneStateStr(solution));
-      } else {
-        reject("No solution found");
+        return;
       }
+
+      reject("No solution found");
     }, 0); // Using setTimeout to make it non-blocking
   });
 }
@@ -1,84 +1,201 @@
 // Contains some general functions used in various other Pipes CSP function implementations
 
+// a PipeType is a 4-bit mask of its openings, with bit i set if the pipe opens in direction i (top, right, bottom, left)
+export type PipeType = number;
 export type Openings = [boolean, boolean, boolean, boolean];
-export type Assignment = Openings[];
-export type PartialAssignment = Array<Openings | null>;
-
-// mapping of PipeTypes to a character that represents them visually.
-const PIPE_CHAR: { [key: string]: string } = {
-  "true,false,false,false": "╵", // Open at the top
-  "false,true,false,false": "╶", // Open at the right
-  "false,false,true,false": "╷", // Open at the bottom
-  "false,false,false,true": "╴", // Open at the left
-  "true,true,false,false": "└", // Elbow (bottom-left)
-  "true,false,true,false": "│", // Vertical pipe
-  "true,false,false,true": "┘", // Elbow (bottom-right)
-  "false,true,true,false": "┌", // Elbow (top-left)
-  "false,true,false,true": "─", // Horizontal pipe
-  "false,false,true,true": "┐", // Elbow (top-right)
-  "true,true,true,false": "├", // T-junction (left, down, up)
-  "true,true,false,true": "┴", // T-junction (left, right, down)
-  "true,false,true,true": "┤", // T-junction (right, down, up)
-  "false,true,true,true": "┬", // T-junction (left, right, up)
-};
-
-function pipeTypeKey(pipe: Openings): string {
-  return pipe.join(",");
-}
+// one byte per pipe, in location order
+export type Assignment = Uint8Array;
+export type PartialAssignment = Array<PipeType | null>;
+
+export const PIPE_TOP = 1;
+export const PIPE_RIGHT = 2;
+export const PIPE_BOTTOM = 4;
+export const PIPE_LEFT = 8;
+
+// OPPOSITE[i] is the direction facing back towards direction i
+export const OPPOSITE: readonly number[] = [2, 3, 0, 1];
+
+// PIPES_WITH_OPENINGS[openings] is the domain mask of every PipeType that has all of the given openings
+export const PIPES_WITH_OPENINGS: readonly number[] = Array.from(
+  { length: 16 },
+  (_, openings) => {
+    let mask = 0;
+    for (let pipe = 0; pipe < 16; pipe++) {
+      if ((pipe & openings) === openings) {
+        mask |= 1 << pipe;
+      }
+    }
+    return mask;
+  }
+);
 
-export function printPipesGrid(pipes: Openings[]): void {
-  const n = Math.sqrt(pipes.length);
-  for (let i = 0; i < pipes.length; i++) {
-    const key = pipeTypeKey(pipes[i]);
-    // Node.js: write a single character (fallback to space if missing)
-    process.stdout.write(PIPE_CHAR[key] || " ");
-    if (i % n === n - 1) {
-      process.stdout.write("\n");
+// character that represents each PipeType visually, indexed by the pipe
+// (no openings and all openings never appear in a puzzle, so they are spaces)
+const PIPE_CHAR = " ╵╶└╷│┌├╴┘─┴┐┤┬ ";
+
+/**
+ * Converts a boolean openings tuple (as used by the UI) into a PipeType bitmask
+ */
+export function openingsToPipe(openings: ArrayLike<boolean>): PipeType {
+  let pipe = 0;
+  for (let i = 0; i < 4; i++) {
+    if (openings[i]) {
+      pipe |= 1 << i;
     }
   }
+  return pipe;
 }
 
-export function findAdj(
-  center: number,
-  n: number
-): [number, number, number, number] {
-  let above = center - n;
-  let right = center + 1;
-  let below = center + n;
-  let left = center - 1;
-
-  if (above < 0) {
-    above = -1;
+/**
+ * Packs a list of PipeTypes into a domain mask, where bit p is set if PipeType p is in the list
+ */
+export function pipesToDomainMask(pipes: readonly PipeType[]): number {
+  let mask = 0;
+  for (const pipe of pipes) {
+    mask |= 1 << pipe;
   }
-  if (right % n === 0) {
-    right = -1;
+  return mask;
+}
+
+/**
+ * Unpacks a domain mask into the PipeTypes it contains, in ascending order
+ */
+export function domainMaskToPipes(mask: number): PipeType[] {
+  const pipes: PipeType[] = [];
+  while (mask !== 0) {
+    const lowest = mask & -mask;
+    pipes.push(31 - Math.clz32(lowest));
+    mask ^= lowest;
   }
-  if (below >= n * n) {
-    below = -1;
+  return pipes;
+}
+
+/**
+ * Counts the set bits of a mask, such as the number of values in a domain mask
+ * @param mask The mask to count
+ * @returns The number of set bits
+ */
+export function popcount(mask: number): number {
+  let count = 0;
+  while (mask !== 0) {
+    mask &= mask - 1;
+    count++;
   }
-  if (left % n === n - 1) {
-    left = -1;
+  return count;
+}
+
+/**
+ * Prints a grid of pipes to stdout, one row per line
+ * @param pipes The pipes of the grid, in row-major order
+ * @param n The size of the grid, for callers that already know it
+ */
+export function printPipesGrid(
+  pipes: ArrayLike<PipeType>,
+  n: number = Math.sqrt(pipes.length)
+): void {
+  const rows: string[] = [];
+  for (let row = 0; row < pipes.length; row += n) {
+    let line = "";
+    for (let loc = row; loc < row + n; loc++) {
+      line += PIPE_CHAR[pipes[loc]];
+    }
+    rows.push(line);
   }
+  // Node.js: write the whole grid at once
+  process.stdout.write(rows.join("\n") + "\n");
+}
 
-  return [above, right, below, left];
+// adjacency tables for each grid size that has been used, see adjTable
+const ADJ_TABLES = new Map<number, Int32Array>();
+
+/**
+ * Gets the adjacency table for an n x n grid, building it the first time it is requested
+ * @param n The size of the grid
+ * @returns A table where entry center * 4 + i is the neighbor of center in direction i, or -1 at the edge of the grid
+ */
+export function adjTable(n: number): Int32Array {
+  let table = ADJ_TABLES.get(n);
+  if (table === undefined) {
+    table = new Int32Array(n * n * 4);
+    for (let center = 0; center < n * n; center++) {
+      const row = Math.floor(center / n);
+      const col = center % n;
+      const base = center * 4;
+      table[base] = row > 0 ? center - n : -1;
+      table[base + 1] = col < n - 1 ? center + 1 : -1;
+      table[base + 2] = row < n - 1 ? center + n : -1;
+      table[base + 3] = col > 0 ? center - 1 : -1;
+    }
+    ADJ_TABLES.set(n, table);
+  }
+  return table;
 }
 
-export function checkConnections(
-  center: Openings,
-  adj: Array<Openings | null>
-): [boolean, boolean, boolean, boolean] {
-  const connections: boolean[] = [false, false, false, false];
-
-  for (let i = 0; i < center.length; i++) {
-    if (center[i]) {
-      const adjPipe = adj[i];
-      if (adjPipe !== null && adjPipe[(i + 2) % 4]) {
-        connections[i] = true;
-      }
+// connections for every pipe and neighborhood, see connectionTable
+let CONNECTION_TABLE: Uint8Array | null = null;
+
+/**
+ * Gets the table of connections between a pipe and its neighbors, building it the first time it is requested
+ * @returns A table where entry center | top << 4 | right << 8 | bottom << 12 | left << 16 has bit i set when center is connected to its neighbor in direction i, with missing neighbors given as 0
+ */
+function connectionTable(): Uint8Array {
+  if (CONNECTION_TABLE === null) {
+    CONNECTION_TABLE = new Uint8Array(1 << 20);
+    for (let key = 0; key < 1 << 20; key++) {
+      // the directions each neighbor opens back towards the center in
+      const back =
+        ((key >>> 6) & 1) |
+        (((key >>> 11) & 1) << 1) |
+        (((key >>> 12) & 1) << 2) |
+        (((key >>> 17) & 1) << 3);
+      CONNECTION_TABLE[key] = key & back;
     }
   }
+  return CONNECTION_TABLE;
+}
+
+/**
+ * Packs the pipes around a location into a single number
+ * @param loc The location to get the neighbors of
+ * @param pipes The (pseudo) assignment of the grid, null for unassigned pipes
+ * @param adj The adjacency table of the grid, see adjTable
+ * @returns The pipes above, right, below and left of loc in bits 0-3, 4-7, 8-11 and 12-15, with 0 for neighbors that are off the grid or unassigned
+ */
+export function getNeighborMask(
+  loc: number,
+  pipes: ArrayLike<PipeType | null>,
+  adj: Int32Array
+): number {
+  const base = loc * 4;
+  const top = adj[base];
+  const right = adj[base + 1];
+  const bottom = adj[base + 2];
+  const left = adj[base + 3];
+
+  return (
+    (top === -1 ? 0 : (pipes[top] ?? 0)) |
+    ((right === -1 ? 0 : (pipes[right] ?? 0)) << 4) |
+    ((bottom === -1 ? 0 : (pipes[bottom] ?? 0)) << 8) |
+    ((left === -1 ? 0 : (pipes[left] ?? 0)) << 12)
+  );
+}
+
+/**
+ * Finds which neighbors of a pipe it is connected to, meaning the pipe opens towards the neighbor and the neighbor opens back
+ * @param loc The location of the pipe
+ * @param pipes The (pseudo) assignment of the grid, null for unassigned pipes
+ * @param adj The adjacency table of the grid, see adjTable
+ * @returns A mask with bit i set when the pipe is connected to its neighbor in direction i
+ */
+export function connectedMask(
+  loc: number,
+  pipes: ArrayLike<PipeType | null>,
+  adj: Int32Array
+): number {
+  const pipe = pipes[loc];
+  if (pipe === null) {
+    return 0;
+  }
 
-  const [connectedUp, connectedRight, connectedDown, connectedLeft] =
-    connections;
-  return [connectedUp, connectedRight, connectedDown, connectedLeft];
+  return connectionTable()[pipe | (getNeighborMask(loc, pipes, adj) << 4)];
 }